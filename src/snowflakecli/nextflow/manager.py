@@ -1,21 +1,31 @@
 from snowflake.cli.api.sql_execution import SqlExecutionMixin
 from snowflake.connector.cursor import SnowflakeCursor
 from snowflakecli.nextflow.util.cmd_runner import CommandRunner
+from snowflakecli.nextflow.util.output_buffer import OutputBuffer
+from snowflakecli.nextflow.util.tarball import TarballPartWriter, write_tarball
+from snowflakecli.nextflow.util.nextflow_config import extra_config_paths, read_simple_config
 from snowflakecli.nextflow.service_spec import (
     Specification, Spec, Container, parse_stage_mounts, VolumeConfig, VolumeMount, Volume, Endpoint
 )
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from snowflake.cli.api.exceptions import CliError
 from snowflake.cli.api.console import cli_console as cc
+import threading
+import queue
+import hashlib
+import importlib.metadata
+import pickle
 import os
-import tarfile
 import tempfile
 from pathlib import Path
-import random
+import secrets
 import string
-from datetime import datetime
 import json
+import re
+import sys
 import asyncio
+import time
 from snowflakecli.nextflow.wss import (
     WebSocketClient,
     WebSocketError,
@@ -24,7 +34,42 @@ from snowflakecli.nextflow.wss import (
     WebSocketInvalidURIError,
     WebSocketServerError
 )
-from typing import Optional
+from typing import BinaryIO, Optional
+
+# Name the project tarball is uploaded under in the run's stage directory, it is
+# split into numbered parts of up to TARBALL_PART_SIZE bytes
+PROJECT_TARBALL_NAME = "project.tar.gz"
+TARBALL_PART_SIZE = 64 * 1024 * 1024
+# Up to this many bytes of tarball parts are kept in memory, later parts are
+# written to temporary files
+TARBALL_SPOOL_MAX_BYTES = 256 * 1024 * 1024
+# Number of finished tarball parts waiting to be uploaded before building the
+# tarball pauses
+TARBALL_PART_QUEUE_SIZE = 2
+# Parsed project configs are cached here to avoid starting nextflow on every run
+CONFIG_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "snowflakecli-nextflow" / "config"
+# Bumped whenever ProjectConfig or the classes it holds change, so older cache
+# entries are no longer used. Entries unused for CONFIG_CACHE_MAX_AGE seconds
+# are removed
+CONFIG_CACHE_VERSION = 1
+CONFIG_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# Configs reading environment variables or including other files depend on more
+# than the files the cache key covers, and are never cached
+CONFIG_UNCACHEABLE_PATTERN = re.compile(r"getenv|\benv\.|\$\{|includeConfig")
+# Seconds to wait in total for the service endpoint to be provisioned and to
+# accept connections
+SERVICE_START_TIMEOUT = 60
+# Delay before polling the service endpoint again in seconds, doubled on every
+# further poll up to the maximum
+ENDPOINT_POLL_INITIAL_DELAY = 0.5
+ENDPOINT_POLL_MAX_DELAY = 5.0
+# Number of tarball parts uploaded concurrently, and the number of threads the
+# connector uploads each of them with
+UPLOAD_WORKERS = 8
+UPLOAD_PARALLELISM = 16
+# Characters and random source run IDs are generated from
+RUN_ID_ALPHABET = string.ascii_lowercase + string.digits
+RUN_ID_RANDOM = secrets.SystemRandom()
 
 @dataclass
 class ProjectConfig:
@@ -32,6 +77,37 @@ class ProjectConfig:
     workDirStage: str = ""
     volumeConfig: VolumeConfig = None
 
+# Maps `nextflow config -flat` keys to the ProjectConfig attribute they set and
+# the function converting the raw value
+CONFIG_SETTINGS = {
+    "snowflake.computePool": ("computePool", str),
+    "snowflake.stageMounts": ("volumeConfig", parse_stage_mounts),
+    "snowflake.workDirStage": ("workDirStage", str),
+}
+
+def _install_uvloop() -> None:
+    """
+    Use uvloop as the asyncio event loop where available, it is considerably
+    faster than the default selector loop at processing small WebSocket frames.
+    """
+    if sys.platform == "win32":
+        return
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+def _generate_run_id() -> str:
+    """
+    Generate 8-character runtime ID that complies with Nextflow naming requirements.
+    Must start with lowercase letter, followed by lowercase letters and digits.
+    Drawn from the OS random source so runs started together get distinct IDs.
+    """
+    first_char = RUN_ID_RANDOM.choice(string.ascii_lowercase)
+    remaining_chars = RUN_ID_RANDOM.choices(RUN_ID_ALPHABET, k=7)
+    return first_char + ''.join(remaining_chars)
+
 class NextflowManager(SqlExecutionMixin):
 
     def __init__(self, project_dir: str, profile: str = None, nf_snowflake_image: str = None):
@@ -43,32 +119,121 @@ class NextflowManager(SqlExecutionMixin):
         self._profile = profile
         self._nf_snowflake_image = nf_snowflake_image
         
-        # Generate random alphanumeric runtime ID using UTC timestamp and random seed
-        utc_timestamp = int(datetime.now().timestamp())
-        random.seed(utc_timestamp)
-        
-        # Generate 8-character runtime ID that complies with Nextflow naming requirements
-        # Must start with lowercase letter, followed by lowercase letters and digits
-        first_char = random.choice(string.ascii_lowercase)
-        remaining_chars = ''.join(random.choices(string.ascii_lowercase + string.digits, k=7))
-        self._run_id = first_char + remaining_chars
+        self._run_id = _generate_run_id()
         self.service_name = f"NXF_MAIN_{self._run_id}"
 
+        # Tag identifying the queries submitting this run
+        self._query_tag = json.dumps({
+            "NEXTFLOW_JOB_TYPE": "main",
+            "NEXTFLOW_RUN_ID": self._run_id,
+        })
+
+        # All statements of a run are issued through one cursor
+        self._cursor = self._conn.cursor()
+
+    def _config_cache_key(self) -> Optional[str]:
+        """
+        Key of the cached ProjectConfig for the current project and profile.
+
+        The key covers every config and script file in the project, as well as
+        the other config files nextflow applies, along with their modification
+        times, so editing, adding or removing any of them invalidates the cached
+        result. It also covers the plugin and cache versions.
+
+        Returns:
+            The key, or None if a config file matches CONFIG_UNCACHEABLE_PATTERN
+            or NXF_CONFIG_FILE names a missing file
+        """
+        try:
+            plugin_version = importlib.metadata.version("snowflake-cli-nextflow-plugin")
+        except importlib.metadata.PackageNotFoundError:
+            plugin_version = ""
+
+        key = hashlib.sha256()
+        key.update(f"{CONFIG_CACHE_VERSION}\0{plugin_version}\0".encode())
+        key.update(str(self._project_dir.resolve()).encode())
+        key.update(b"\0" + (self._profile or "").encode())
+
+        cacheable = True
+        def add_file(path: str) -> None:
+            nonlocal cacheable
+            key.update(f"\0{path}\0{os.stat(path).st_mtime_ns}".encode())
+            if cacheable and not path.endswith(".nf"):
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    cacheable = not CONFIG_UNCACHEABLE_PATTERN.search(f.read())
+
+        for root, dirs, files in os.walk(self._project_dir):
+            # Skip VCS metadata and, at the top level, Nextflow's own work directory
+            top_level = root == str(self._project_dir)
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and not (top_level and d == "work"))
+            for name in sorted(files):
+                if name.endswith((".config", ".nf")):
+                    add_file(os.path.join(root, name))
+
+        for path in extra_config_paths(self._project_dir / "nextflow.config"):
+            if not os.path.isfile(path):
+                return None
+            add_file(path)
+
+        return key.hexdigest() if cacheable else None
+
+    def _prune_config_cache(self) -> None:
+        """Remove the config cache entries that haven't been used for CONFIG_CACHE_MAX_AGE"""
+        expiry = time.time() - CONFIG_CACHE_MAX_AGE
+        with os.scandir(CONFIG_CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < expiry:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    # Removed concurrently by another run
+                    pass
+
     def _parse_config(self) -> ProjectConfig:
         """
         Parse the nextflow.config file and return a ProjectConfig object.
+
+        Running `nextflow config` means starting a JVM. Simple declarative
+        configs are read directly instead, and otherwise the result is cached
+        on disk and reused until the project's config files change, unless it
+        may depend on other inputs.
         """
 
+        values = read_simple_config(self._project_dir / "nextflow.config", self._profile, CONFIG_SETTINGS)
+        if values is not None:
+            config = ProjectConfig()
+            for key, value in values.items():
+                attr, convert = CONFIG_SETTINGS[key]
+                setattr(config, attr, convert(value))
+            return config
+
+        cache_key = self._config_cache_key()
+        cache_path = CONFIG_CACHE_DIR / f"{cache_key}.pkl" if cache_key else None
+        if cache_path is not None:
+            try:
+                with open(cache_path, "rb") as f:
+                    config = pickle.load(f)
+                # Mark the entry as used, so it isn't pruned
+                os.utime(cache_path)
+                return config
+            except Exception:
+                # Missing or unreadable cache entry, fall back to running nextflow
+                pass
+
         config = ProjectConfig()
 
+        found = set()
         def parse_config_line(line: str) -> None:
-            key, val = line.split(" = ")
-            if key == "snowflake.computePool":
-                config.computePool = val.strip().replace("'", "")
-            elif key == "snowflake.stageMounts":
-                config.volumeConfig = parse_stage_mounts(val.strip().replace("'", ""))
-            elif key == "snowflake.workDirStage":
-                config.workDirStage = val.strip().replace("'", "")
+            key, _, val = line.partition(" = ")
+            setting = CONFIG_SETTINGS.get(key)
+            if setting is None:
+                return
+            attr, convert = setting
+            setattr(config, attr, convert(val.strip().replace("'", "")))
+            found.add(key)
+            # Nothing else in the config is of interest once all settings are known
+            if len(found) == len(CONFIG_SETTINGS):
+                runner.stop()
 
         stderr = []
         def collect_stderr(line: str) -> None:
@@ -87,69 +252,120 @@ class NextflowManager(SqlExecutionMixin):
             err_msg += "\n".join(stderr)
             raise CliError(err_msg)
 
-        
+        if cache_path is not None:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile(dir=cache_path.parent, delete=False) as f:
+                    pickle.dump(config, f)
+                os.replace(f.name, cache_path)
+                self._prune_config_cache()
+            except OSError:
+                # Caching is best effort
+                pass
+
         return config
 
-    def _upload_project(self, config: ProjectConfig) -> str:
+    def _create_tarball_parts(self, project_path: Path, parts: queue.Queue, cancelled: threading.Event) -> None:
         """
-        Create a tarball of the project directory and upload to Snowflake stage.
+        Create the gzipped tarball of the project directory, split into parts of
+        at most TARBALL_PART_SIZE bytes.
+
+        Each part is put on the parts queue as an (index, file object) tuple as
+        soon as it is complete, followed by None once there are no more parts,
+        also if creating the tarball fails or is cancelled.
         """
-        
-        # Create temporary file for the tarball
-        with tempfile.NamedTemporaryFile(suffix='.tar.gz', delete=False) as temp_file:
-            temp_tarball_path = temp_file.name
-        
+        writer = TarballPartWriter(
+            TARBALL_PART_SIZE, TARBALL_SPOOL_MAX_BYTES, lambda index, part: parts.put((index, part)), cancelled
+        )
         try:
-            cc.step("Creating tarball...")
-            # Create tarball excluding .git directory
-            self._create_tarball(self._project_dir, temp_tarball_path)
-            
-            cc.step(f"Uploading to stage {config.workDirStage}...")
-            # Upload to Snowflake stage
-            self.execute_query(f"PUT file://{temp_tarball_path} @{config.workDirStage}/{self._run_id}")
-
-            return temp_tarball_path
-            
+            self._create_tarball(project_path, writer)
+            writer.close()
+        except Exception:
+            writer.discard()
+            raise
         finally:
-            # Clean up temporary file
-            if os.path.exists(temp_tarball_path):
-                os.unlink(temp_tarball_path)
+            parts.put(None)
+
+    def _upload_tarball_parts(self, config: ProjectConfig, parts: queue.Queue, cancelled: threading.Event) -> str:
+        """
+        Upload the project tarball parts to Snowflake stage, concurrently, as
+        they are taken from the parts queue filled by _create_tarball_parts.
+
+        Each part is streamed from the file object it was built in, so it is
+        never written out and read back, and closed once it is uploaded.
+
+        If an upload fails, or waiting for the uploads is interrupted, the
+        cancelled event is set so the other workers stop taking new parts.
+
+        Returns:
+            Name prefix of the tarball parts on the stage
+        """
+        cc.step(f"Uploading to stage {config.workDirStage}...")
+
+        def upload_parts() -> None:
+            # Cursors are not shared between threads
+            with self._conn.cursor() as cursor:
+                while not cancelled.is_set():
+                    item = parts.get()
+                    if item is None:
+                        # Leave the end marker for the other workers
+                        parts.put(None)
+                        return
+                    index, part = item
+                    with part:
+                        part.seek(0)
+                        cursor.execute(
+                            # Parts are slices of the gzip stream, store them as they are
+                            f"PUT file://{PROJECT_TARBALL_NAME}.part-{index:04d} @{config.workDirStage}/{self._run_id}"
+                            f" AUTO_COMPRESS=FALSE SOURCE_COMPRESSION=NONE OVERWRITE=TRUE PARALLEL={UPLOAD_PARALLELISM}",
+                            file_stream=part,
+                        )
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            futures = [executor.submit(upload_parts) for _ in range(UPLOAD_WORKERS)]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                cancelled.set()
+                raise
+
+        return PROJECT_TARBALL_NAME + ".part-"
     
-    def _create_tarball(self, project_path: Path, tarball_path: str):
+    def _create_tarball(self, project_path: Path, fileobj: BinaryIO):
         """
         Create a tarball of the project directory, excluding .git and other unwanted files.
         
         Args:
             project_path: Path to the project directory
-            tarball_path: Path where the tarball should be created
+            fileobj: File object the gzipped tarball is written to
         """
         
-        def tar_filter(tarinfo):
-            """Filter function to exclude unwanted files/directories"""
-            # Exclude other common unwanted files/directories
-            excluded_patterns = [
-                '.git',
-                '.gitignore',
-            ]
-            
-            for pattern in excluded_patterns:
-                if pattern in tarinfo.name:
-                    return None
-            
-            return tarinfo
-        
         try:
-            with tarfile.open(tarball_path, 'w:gz') as tar:
-                # Add all files from project directory with filtering
-                tar.add(
-                    project_path, 
-                    arcname=project_path.name,  # Use project name as root in archive
-                    filter=tar_filter
-                )
-                
+            write_tarball(project_path, fileobj)
         except Exception as e:
             raise CliError(f"Failed to create tarball: {str(e)}")
         
+    def _get_ingress_url(self, service_name: str, deadline: float) -> str:
+        """
+        Poll the service endpoints until the public ingress URL has been provisioned.
+
+        Args:
+            service_name: Name of the service
+            deadline: time.monotonic() value after which to give up
+        """
+        attempt = 0
+        while True:
+            row = self._cursor.execute(f"show endpoints in service {service_name}").fetchone()
+            # While provisioning the column holds a message rather than a host name
+            if row and row[5] and " " not in row[5]:
+                return row[5]
+            if time.monotonic() >= deadline:
+                raise CliError(f"Timed out waiting for the endpoint of service {service_name}")
+            delay = min(ENDPOINT_POLL_INITIAL_DELAY * 2 ** attempt, ENDPOINT_POLL_MAX_DELAY)
+            time.sleep(max(min(delay, deadline - time.monotonic()), 0))
+            attempt += 1
+
     def _stream_service_logs(self, service_name: str) -> Optional[int]:
         """
         Connect to service WebSocket endpoint and stream logs.
@@ -160,15 +376,20 @@ class NextflowManager(SqlExecutionMixin):
         Returns:
             Exit code if execution completed successfully, None otherwise
         """
+        # Waiting for the endpoint and for the service to accept connections
+        # share one time budget
+        deadline = time.monotonic() + SERVICE_START_TIMEOUT
+
         # Get WebSocket endpoint
-        cursor = self.execute_query(f"show endpoints in service {service_name}")
-        wss_url = cursor.fetchone()[5]
+        wss_url = self._get_ingress_url(service_name, deadline)
         
         # Callback functions for WebSocket events
+        stdout = OutputBuffer()
         def on_message(message: str) -> None:
-            print(message, end='')
+            stdout.write(message)
         
         def on_status(status: str, data: dict) -> None:
+            stdout.flush()
             if status == 'starting':
                 cc.step(f"Starting: {data.get('command', '')}")
             elif status == 'started':
@@ -177,6 +398,8 @@ class NextflowManager(SqlExecutionMixin):
                 cc.step(f"Connected to WebSocket server")
                 cc.step("Streaming live output... (Press Ctrl+C to stop)")
                 cc.step("=" * 50)
+            elif status == 'retrying' and data.get('attempt') == 1:
+                cc.step("Waiting for service to accept connections...")
             elif status == 'disconnected':
                 cc.step(f"Disconnected: {data.get('reason', '')}")
         
@@ -184,13 +407,16 @@ class NextflowManager(SqlExecutionMixin):
             cc.warning(f"Processing error: {message}")
         
         exit_code = None
+        _install_uvloop()
         # Create WebSocket client and connect
         try:
             wss_client = WebSocketClient(
                 conn=self._conn,
                 message_callback=on_message,
+                bytes_callback=stdout.write,
                 status_callback=on_status,
-                error_callback=on_error
+                error_callback=on_error,
+                connect_timeout=max(deadline - time.monotonic(), 0)
             )
             exit_code = asyncio.run(wss_client.connect_and_stream("wss://"+wss_url))
         except WebSocketInvalidURIError as e:
@@ -208,25 +434,17 @@ class NextflowManager(SqlExecutionMixin):
             raise CliError(f"WebSocket error: {e}")
         except KeyboardInterrupt:
             cc.step("Disconnected by user")
+        finally:
+            stdout.flush()
         
         return exit_code
 
-    def _submit_nextflow_job(self, config: ProjectConfig, tarball_path: str) -> Optional[int]:
+    def _submit_nextflow_job(self, config: ProjectConfig, tarball_prefix: str) -> None:
         """
-        Run the nextflow pipeline.
-        
-        Returns:
-            Exit code if execution completed successfully, None otherwise
+        Create the service running the nextflow pipeline. This doesn't wait for
+        the service to start.
         """
-        tags = json.dumps({
-            "NEXTFLOW_JOB_TYPE": "main",
-            "NEXTFLOW_RUN_ID": self._run_id,
-        })
-
-        self.execute_query(f"alter session set query_tag = '{tags}'")
-
         workDir = "/mnt/workdir"
-        tarball_filename = os.path.basename(tarball_path)
 
         nf_run_cmds = [
             "nextflow",
@@ -251,16 +469,20 @@ class NextflowManager(SqlExecutionMixin):
         run_script = f"""
         mkdir -p /mnt/project
         cd /mnt/project
-        tar -zxf {workDir}/{tarball_filename}
+        if command -v pigz > /dev/null; then decompress="pigz -dc"; else decompress="gzip -dc"; fi
+        cat {workDir}/{tarball_prefix}* | $decompress | tar -xf -
         python3 /app/pty_server.py -- {' '.join(nf_run_cmds)}
         """
 
-        config.volumeConfig.volumeMounts.append(
+        # Extend copies of the configured volumes so the parsed config is left
+        # untouched and the spec only depends on the inputs
+        volume_config = config.volumeConfig or VolumeConfig(volumes=[], volumeMounts=[])
+        volume_mounts = volume_config.volumeMounts + [
             VolumeMount(name="workdir", mountPath=workDir)
-        )
-        config.volumeConfig.volumes.append(
+        ]
+        volumes = volume_config.volumes + [
             Volume(name="workdir", source="@"+config.workDirStage+"/"+self._run_id+"/")
-        )
+        ]
 
         spec = Specification(
             spec = Spec(
@@ -269,10 +491,10 @@ class NextflowManager(SqlExecutionMixin):
                         name="nf-main",
                         image=self._nf_snowflake_image,
                         command=["/bin/bash", "-c", run_script],
-                        volumeMounts=config.volumeConfig.volumeMounts
+                        volumeMounts=volume_mounts
                     )
                 ],
-                volumes = config.volumeConfig.volumes,
+                volumes = volumes,
                 endpoints = [
                     Endpoint(name="wss", port=8765, public=True)
                 ]
@@ -289,9 +511,15 @@ FROM SPECIFICATION $$
 {yaml_spec}
 $$
         """
-        self.execute_query(execute_sql)
-        self.execute_query(f"call system$wait_for_services(30, '{self.service_name}')")
-        self.execute_query("alter session unset query_tag")
+        # Only CREATE SERVICE needs the tag. Tag, create and untag are sent as a
+        # single multi-statement request to save round trips
+        batch_sql = f"alter session set query_tag = '{self._query_tag}';\n{execute_sql.strip()};\nalter session unset query_tag;"
+        try:
+            self._cursor.execute(batch_sql, num_statements=3)
+        except Exception:
+            # Statements following a failed one are not run, unset the tag anyway
+            self._cursor.execute("alter session unset query_tag")
+            raise
 
 
     def run(self) -> Optional[int]:
@@ -301,20 +529,39 @@ $$
         Returns:
             Exit code if execution completed successfully, None otherwise
         """
-        cc.step("Parsing nextflow.config...")
-        config = self._parse_config()
-
-        tarball_path = None
-        with cc.phase("Uploading project to Snowflake..."):
-            tarball_path = self._upload_project(config)
-
-        try: 
-            cc.step("Submitting nextflow job to Snowflake...")
-            exit_code = self._submit_nextflow_job(config, tarball_path)
-            # Stream logs and get exit code
-            exit_code = self._stream_service_logs(self.service_name)
-        finally:
-            self.execute_query("drop service if exists "+self.service_name)
+        # The cursor is closed once the run is over
+        with self._cursor:
+            parts = queue.Queue(maxsize=TARBALL_PART_QUEUE_SIZE)
+            cancelled = threading.Event()
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                # The tarball doesn't depend on the config, start building it
+                # while the config is parsed. Parts are uploaded as they are
+                # completed, while later ones are still being built
+                tarball_future = executor.submit(self._create_tarball_parts, self._project_dir, parts, cancelled)
+                try:
+                    cc.step("Parsing nextflow.config...")
+                    config = self._parse_config()
+
+                    with cc.phase("Uploading project to Snowflake..."):
+                        cc.step("Creating tarball...")
+                        tarball_prefix = self._upload_tarball_parts(config, parts, cancelled)
+                finally:
+                    # Abort building the tarball if the upload was cut short,
+                    # and release the parts left over. Once everything is
+                    # uploaded the tarball is already complete
+                    cancelled.set()
+                    while (item := parts.get()) is not None:
+                        item[1].close()
+                tarball_future.result()
+
+            try: 
+                cc.step("Submitting nextflow job to Snowflake...")
+                self._submit_nextflow_job(config, tarball_prefix)
+                # Stream logs and get exit code, this waits for the service to come up
+                exit_code = self._stream_service_logs(self.service_name)
+            finally:
+                # Only submit the drop, there's no need to keep the user waiting
+                # for the service to be torn down
+                self._cursor.execute_async("drop service if exists "+self.service_name)
 
-        
         return exit_code
@@ -1,6 +1,42 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields, is_dataclass
 from snowflake.cli.api.exceptions import CliError
-import yaml
+from typing import List
+import json
+import re
+
+# Characters json.dumps leaves as they are with ensure_ascii=False, that YAML
+# either doesn't allow unescaped (DEL, C1 controls, U+FFFE and U+FFFF) or reads
+# as line breaks within quoted strings (NEL, U+2028 and U+2029)
+YAML_UNSAFE_CHARACTERS = re.compile("[\x7f-\x9f\u2028\u2029\ufffe\uffff]")
+
+def _yaml_scalar(value) -> str:
+    """Write a scalar as JSON, which YAML reads the same way, with YAML_UNSAFE_CHARACTERS escaped"""
+    text = json.dumps(value, ensure_ascii=False)
+    return YAML_UNSAFE_CHARACTERS.sub(lambda m: f"\\u{ord(m.group()):04x}", text)
+
+def _yaml_lines(value) -> List[str]:
+    """
+    Render a spec dataclass as the lines of a YAML block mapping, unindented.
+
+    The spec schema is small and fixed, so it is written out directly rather
+    than through a general purpose YAML library. Scalars are written as JSON,
+    which YAML reads the same way, so strings are always safely quoted.
+    """
+    lines = []
+    for field in fields(value):
+        item = getattr(value, field.name)
+        if is_dataclass(item):
+            lines.append(f"{field.name}:")
+            lines += ["  " + line for line in _yaml_lines(item)]
+        elif isinstance(item, list) and item:
+            lines.append(f"{field.name}:")
+            for element in item:
+                element_lines = _yaml_lines(element) if is_dataclass(element) else [_yaml_scalar(element)]
+                lines.append("- " + element_lines[0])
+                lines += ["  " + line for line in element_lines[1:]]
+        else:
+            lines.append(f"{field.name}: {_yaml_scalar(item)}")
+    return lines
 
 @dataclass
 class VolumeMount:
@@ -42,8 +78,7 @@ class Specification:
         Returns:
             YAML string representation of the ServiceSpec
         """
-        spec_dict = asdict(self)
-        return yaml.dump(spec_dict, default_flow_style=False, indent=2)
+        return "\n".join(_yaml_lines(self)) + "\n"
     
 @dataclass
 class VolumeConfig:
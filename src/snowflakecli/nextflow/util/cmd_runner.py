@@ -1,45 +1,103 @@
-from typing import Callable, List, Optional
+from typing import Callable, IO, List, Optional
 import subprocess
+import threading
 import os
 from snowflake.cli.api.exceptions import CliError
 
+# Number of bytes read from the command's output at a time
+READ_CHUNK_SIZE = 64 * 1024
+
 class CommandRunner:
+    """
+    Runs a command, passing each line it writes to stdout and stderr to the
+    respective callback. Both streams are read concurrently, so callbacks are
+    invoked from reader threads. An exception raised by a callback stops the
+    command and is re-raised by run().
+    """
+
     def __init__(self):
         self.stdout_callback: Optional[Callable[[str], None]] = None
         self.stderr_callback: Optional[Callable[[str], None]] = None
-        
+        self._process: Optional[subprocess.Popen] = None
+        self._stopped = False
+        self._callback_error: Optional[Exception] = None
+
     def set_stdout_callback(self, callback: Callable[[str], None]):
         self.stdout_callback = callback
         return self
-        
+
     def set_stderr_callback(self, callback: Callable[[str], None]):
         self.stderr_callback = callback
         return self
-    
+
+    def stop(self):
+        """
+        Stop the running command, typically from within an output callback once
+        it has produced everything of interest. A stopped command counts as
+        successful.
+        """
+        self._stopped = True
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+
     def run(self, cmd: List[str]) -> int:
+        self._stopped = False
+        self._callback_error = None
         try:
             env = os.environ.copy()
-            process = subprocess.Popen(
-                " ".join(cmd),
+            self._process = subprocess.Popen(
+                cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                shell=True,
+                bufsize=0,
                 env=env,
             )
-            
-            # Process stdout
-            if self.stdout_callback:
-                for line in process.stdout:
-                    self.stdout_callback(line.rstrip('\n'))
-            
-            # Process stderr
-            if self.stderr_callback:
-                for line in process.stderr:
-                    self.stderr_callback(line.rstrip('\n'))
-            
-            return process.wait()
-            
         except FileNotFoundError:
             raise CliError(f"Command not found: {cmd[0]}")
+
+        # Drain both pipes at once, so the command never blocks writing to one
+        # while the other is being read
+        readers = [
+            threading.Thread(target=self._drain, args=(self._process.stdout, self.stdout_callback), daemon=True),
+            threading.Thread(target=self._drain, args=(self._process.stderr, self.stderr_callback), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+
+        ret = self._process.wait()
+        self._process = None
+        if self._callback_error is not None:
+            raise self._callback_error
+        return 0 if self._stopped else ret
+
+    def _drain(self, stream: IO[bytes], callback: Optional[Callable[[str], None]]) -> None:
+        # Read in large chunks and split them into lines here, rather than
+        # issuing a read per line
+        fd = stream.fileno()
+        leftover = b''
+        with stream:
+            try:
+                while True:
+                    chunk = os.read(fd, READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    lines = (leftover + chunk).split(b'\n')
+                    leftover = lines.pop()
+                    self._dispatch(lines, callback)
+                if leftover:
+                    self._dispatch([leftover], callback)
+            except Exception as e:
+                # Hand the error over to run(), it would be lost on this thread
+                if self._callback_error is None:
+                    self._callback_error = e
+                self.stop()
+
+    def _dispatch(self, lines: List[bytes], callback: Optional[Callable[[str], None]]) -> None:
+        if callback is None:
+            return
+        for line in lines:
+            if self._stopped:
+                return
+            callback(line.decode(errors='replace').rstrip('\r'))
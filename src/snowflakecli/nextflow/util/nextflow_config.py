@@ -0,0 +1,107 @@
+from typing import Dict, Iterable, List, Optional
+from pathlib import Path
+import os
+import re
+
+# Line patterns of the declarative nextflow.config subset read without nextflow
+CONFIG_IGNORED_LINE = re.compile(r"^\s*(//.*)?$")
+CONFIG_BLOCK_START = re.compile(r"^\s*([A-Za-z_]\w*)\s*\{\s*(//.*)?$")
+CONFIG_BLOCK_END = re.compile(r"^\s*\}\s*(//.*)?$")
+CONFIG_ASSIGNMENT = re.compile(
+    r"""^\s*([A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*)\s*=\s*"""
+    r"""('[^'\\]*'|"[^"\\$]*"|-?\d+(?:\.\d+)?|true|false)\s*(//.*)?$"""
+)
+
+def global_config_path() -> str:
+    """Path of the user's global nextflow config, applied on top of every project config"""
+    nxf_home = os.environ.get("NXF_HOME", os.path.join(Path.home(), ".nextflow"))
+    return os.path.join(nxf_home, "config")
+
+def extra_config_paths(project_config: Path) -> List[str]:
+    """
+    Paths of the config files nextflow applies besides the project's own
+    nextflow.config: the user's global config in NXF_HOME and the launch
+    directory's nextflow.config, if they exist, and the file named by
+    NXF_CONFIG_FILE whenever it is set.
+    """
+    paths = []
+    global_config = global_config_path()
+    if os.path.isfile(global_config):
+        paths.append(global_config)
+    launch_config = os.path.join(os.getcwd(), "nextflow.config")
+    # When launched from within the project, its config is the launch directory's
+    if os.path.isfile(launch_config) and not (project_config.is_file() and os.path.samefile(launch_config, project_config)):
+        paths.append(launch_config)
+    if os.environ.get("NXF_CONFIG_FILE"):
+        paths.append(os.environ["NXF_CONFIG_FILE"])
+    return paths
+
+def read_simple_config(config_path: Path, profile: Optional[str], keys: Iterable[str]) -> Optional[Dict[str, str]]:
+    """
+    Read the raw values of the given config keys from nextflow.config without
+    starting nextflow. Keys the config doesn't set are left out of the result.
+
+    Only configs made up entirely of comments, scope blocks and assignments of
+    literal values are understood, including settings inside profile blocks.
+    None is returned for anything else (includes, closures, interpolated
+    strings, selectors, ...) as well as when any of extra_config_paths exists or
+    a requested profile isn't found, so the caller falls back to `nextflow config`.
+
+    Nextflow applies profile blocks in file order, interleaved with the other
+    assignments, which isn't tracked here. So None is also returned when more
+    than one profile is selected, or when the selected profile sets one of the
+    keys that is also assigned outside of it.
+    """
+    if not config_path.is_file() or extra_config_paths(config_path):
+        return None
+    try:
+        text = config_path.read_text(encoding="utf-8")
+    except UnicodeDecodeError:
+        return None
+
+    values = {}
+    profile_values = {}
+    scopes = []
+    for line in text.splitlines():
+        if CONFIG_IGNORED_LINE.match(line):
+            continue
+        match = CONFIG_BLOCK_START.match(line)
+        if match:
+            scopes.append(match.group(1))
+            continue
+        if CONFIG_BLOCK_END.match(line):
+            if not scopes:
+                return None
+            scopes.pop()
+            continue
+        match = CONFIG_ASSIGNMENT.match(line)
+        if not match:
+            return None
+
+        key = scopes + match.group(1).split(".")
+        value = match.group(2).strip("'\"")
+        if key[0] == "profiles":
+            if len(key) < 3:
+                return None
+            profile_values.setdefault(key[1], {})[".".join(key[2:])] = value
+        else:
+            values[".".join(key)] = value
+
+    if scopes:
+        return None
+
+    # Without -profile nextflow applies the `standard` profile, if there is one
+    if profile:
+        profiles = profile.split(",")
+    else:
+        profiles = ["standard"] if "standard" in profile_values else []
+    if len(profiles) > 1:
+        return None
+    for name in profiles:
+        if name not in profile_values:
+            return None
+        if profile_values[name].keys() & values.keys() & set(keys):
+            return None
+        values.update(profile_values[name])
+
+    return {key: values[key] for key in keys if key in values}
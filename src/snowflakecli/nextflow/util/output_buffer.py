@@ -0,0 +1,57 @@
+from typing import Optional, TextIO, Union
+import asyncio
+import sys
+
+class OutputBuffer:
+    """
+    Accumulates streamed output and writes it out in batches, either once the
+    buffered data passes a size threshold or after a short delay, whichever
+    comes first.
+
+    Batches are written as bytes to the stream's underlying binary buffer when
+    it has one, skipping the text layer's encoding. Going through the buffer
+    rather than the file descriptor keeps the console handling on Windows.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, threshold: int = 4096, interval: float = 0.1):
+        self._stream = stream or sys.stdout
+        self._threshold = threshold
+        self._interval = interval
+        self._buffer = bytearray()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._binary = getattr(self._stream, "buffer", None)
+
+    def write(self, data: Union[str, bytes]) -> None:
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer += data
+        if len(self._buffer) >= self._threshold:
+            self.flush()
+        elif self._timer is None:
+            self._schedule_flush()
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Anything printed to the stream directly goes out first to keep the
+        # output in order
+        self._stream.flush()
+        if not self._buffer:
+            return
+        if self._binary is not None:
+            self._binary.write(self._buffer)
+            self._binary.flush()
+        else:
+            self._stream.write(self._buffer.decode(errors='replace'))
+            self._stream.flush()
+        self._buffer.clear()
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not called from the event loop, nothing can fire the timer
+            self.flush()
+            return
+        self._timer = loop.call_later(self._interval, self.flush)
@@ -0,0 +1,199 @@
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+from snowflake.cli.api.exceptions import CliError
+import gzip
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import threading
+
+# Names of files and directories left out of the project tarball, wherever they
+# appear in the project, and only at its top level where nextflow creates them
+TARBALL_EXCLUDED_NAMES = frozenset({'.git', '.gitignore', '__pycache__'})
+TARBALL_EXCLUDED_ROOT_NAMES = TARBALL_EXCLUDED_NAMES | {'.nextflow', 'work'}
+# Fastest gzip level, source trees barely compress better at the default of 9
+TARBALL_COMPRESS_LEVEL = 1
+
+def walk_project(project_path: Path, arcname: str) -> Iterator[Tuple[str, str, os.stat_result]]:
+    """
+    Walk the project directory, yielding the path, archive name and lstat result
+    of every entry to include in the tarball, in a stable order.
+
+    Excluded directories are pruned before they are descended into, so their
+    contents are never listed or stat'ed.
+    """
+    yield str(project_path), arcname, os.lstat(project_path)
+
+    stack = [(str(project_path), arcname)]
+    while stack:
+        dir_path, dir_arcname = stack.pop()
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+
+        excluded = TARBALL_EXCLUDED_ROOT_NAMES if dir_arcname == arcname else TARBALL_EXCLUDED_NAMES
+        subdirs = []
+        for entry in entries:
+            if entry.name in excluded:
+                continue
+            entry_arcname = dir_arcname + "/" + entry.name
+            yield entry.path, entry_arcname, entry.stat(follow_symlinks=False)
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.path, entry_arcname))
+
+        # Reversed so directories are popped, and archived, in name order
+        stack.extend(reversed(subdirs))
+
+def make_tarinfo(path: str, arcname: str, st: os.stat_result) -> Optional[tarfile.TarInfo]:
+    """
+    Build the TarInfo for an entry from its stat result. Owner names are left
+    empty rather than resolved through the user and group databases, and
+    special files like sockets or FIFOs are skipped by returning None.
+    """
+    tarinfo = tarfile.TarInfo(arcname)
+    tarinfo.mode = stat.S_IMODE(st.st_mode)
+    tarinfo.mtime = st.st_mtime
+    tarinfo.uid = st.st_uid
+    tarinfo.gid = st.st_gid
+
+    if stat.S_ISREG(st.st_mode):
+        tarinfo.type = tarfile.REGTYPE
+        tarinfo.size = st.st_size
+    elif stat.S_ISDIR(st.st_mode):
+        tarinfo.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = os.readlink(path)
+    else:
+        return None
+
+    return tarinfo
+
+@contextmanager
+def gzip_compressor(fileobj: BinaryIO) -> Iterator[BinaryIO]:
+    """
+    Yield a writable stream whose data is gzip compressed into fileobj. pigz is
+    used to compress on all cores when it is installed, the gzip module otherwise.
+    """
+    pigz = shutil.which("pigz")
+    if pigz is None:
+        with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=TARBALL_COMPRESS_LEVEL) as gz:
+            yield gz
+        return
+
+    process = subprocess.Popen(
+        [pigz, "-c", f"-{TARBALL_COMPRESS_LEVEL}", "-p", str(os.cpu_count() or 1)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    # Drain pigz's output on a separate thread so neither end of the pipes blocks
+    copy_errors = []
+    def copy_output() -> None:
+        try:
+            shutil.copyfileobj(process.stdout, fileobj)
+        except Exception as e:
+            copy_errors.append(e)
+            # Unblock the writer, it fails on the broken pipe
+            process.kill()
+
+    reader = threading.Thread(target=copy_output, daemon=True)
+    reader.start()
+    try:
+        yield process.stdin
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        reader.join()
+        ret = process.wait()
+
+    if copy_errors:
+        raise copy_errors[0]
+    if ret != 0:
+        raise CliError(f"pigz exited with code {ret}")
+
+def write_tarball(project_path: Path, fileobj: BinaryIO) -> None:
+    """
+    Write the gzipped tarball of the project directory to fileobj, with the
+    project directory's name as the root of the archive.
+    """
+    # Write the archive as a forward-only stream, compression is layered
+    # on separately so it can be done by pigz
+    with gzip_compressor(fileobj) as gz, tarfile.open(fileobj=gz, mode='w|') as tar:
+        # Use project name as root in archive
+        for path, arcname, st in walk_project(project_path, project_path.name):
+            tarinfo = make_tarinfo(path, arcname, st)
+            if tarinfo is None:
+                continue
+            if tarinfo.isreg():
+                with open(path, 'rb') as f:
+                    tar.addfile(tarinfo, f)
+            else:
+                tar.addfile(tarinfo)
+
+class TarballPartWriter:
+    """
+    Write-only file object splitting the bytes written to it into parts of at
+    most part_size bytes. Each part is passed to on_part along with its index
+    once it is complete, the last one when the writer is closed. Parts are kept
+    in memory while the total stays within memory_budget, further parts are
+    backed by temporary files.
+
+    Writing raises CliError once the cancelled event is set, aborting whatever
+    is producing the data.
+    """
+
+    def __init__(self, part_size: int, memory_budget: int, on_part: Callable[[int, BinaryIO], None],
+                 cancelled: threading.Event):
+        self._part_size = part_size
+        self._memory_left = memory_budget
+        self._on_part = on_part
+        self._cancelled = cancelled
+        self._part: Optional[BinaryIO] = None
+        self._part_count = 0
+        self._current_size = part_size
+
+    def write(self, data) -> int:
+        if self._cancelled.is_set():
+            raise CliError("Tarball creation was cancelled")
+        with memoryview(data) as view:
+            written = 0
+            while written < len(view):
+                if self._current_size >= self._part_size:
+                    self._start_part()
+                size = min(len(view) - written, self._part_size - self._current_size)
+                self._part.write(view[written:written+size])
+                self._current_size += size
+                written += size
+        return written
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._finish_part()
+
+    def discard(self) -> None:
+        """Drop the part being written, e.g. after an error"""
+        if self._part is not None:
+            self._part.close()
+            self._part = None
+
+    def _finish_part(self) -> None:
+        if self._part is not None:
+            part, self._part = self._part, None
+            self._on_part(self._part_count - 1, part)
+
+    def _start_part(self) -> None:
+        self._finish_part()
+        if self._memory_left >= self._part_size:
+            self._memory_left -= self._part_size
+            self._part = tempfile.SpooledTemporaryFile(max_size=self._part_size)
+        else:
+            self._part = tempfile.TemporaryFile()
+        self._part_count += 1
+        self._current_size = 0
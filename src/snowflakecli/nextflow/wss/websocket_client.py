@@ -6,10 +6,19 @@ with Snowflake authentication for streaming real-time output from Nextflow proce
 """
 
 import websockets
-from websockets.exceptions import ConnectionClosed, InvalidURI, InvalidHandshake
+from websockets.exceptions import ConnectionClosed, InvalidURI, InvalidHandshake, InvalidStatus
+import asyncio
+import functools
 import json
 import ssl
-from typing import Callable, Optional, Dict, Any
+import sys
+import time
+from typing import Callable, Optional, Dict, Any, Tuple
+try:
+    # Parses bytes directly and is several times faster than the json module
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
 from .websocket_exceptions import (
     WebSocketError,
     WebSocketConnectionError,
@@ -18,6 +27,26 @@ from .websocket_exceptions import (
     WebSocketServerError
 )
 
+# HTTP statuses returned by the ingress while the service is not ready yet
+RETRYABLE_STATUS_CODES = (502, 503, 504)
+# Lifetime assumed for session tokens when the token response doesn't state it,
+# and how long before expiry a new one is requested, in seconds
+AUTH_TOKEN_DEFAULT_VALIDITY = 60 * 60
+AUTH_TOKEN_RENEWAL_MARGIN = 5 * 60
+# Delay before the first connection retry in seconds, doubled on every further
+# attempt up to the maximum
+CONNECT_RETRY_INITIAL_DELAY = 0.5
+CONNECT_RETRY_MAX_DELAY = 5.0
+
+
+@functools.lru_cache(maxsize=None)
+def _ssl_context() -> ssl.SSLContext:
+    """
+    SSL context shared by all connections, so the system trust store is loaded
+    once. Created on first use rather than at import, as most CLI commands never
+    open a WebSocket.
+    """
+    return ssl.create_default_context()
 
 class WebSocketClient:
     """
@@ -30,26 +59,40 @@ class WebSocketClient:
     def __init__(self, 
                  conn,
                  message_callback: Optional[Callable[[str], None]] = None,
+                 bytes_callback: Optional[Callable[[bytes], None]] = None,
                  status_callback: Optional[Callable[[str, Dict[str, Any]], None]] = None,
-                 error_callback: Optional[Callable[[str, Exception], None]] = None):
+                 error_callback: Optional[Callable[[str, Exception], None]] = None,
+                 connect_timeout: float = 0.0):
         """
         Initialize WebSocket client.
         
         Args:
             conn: Snowflake connection object
-            message_callback: Callback for output messages (type, data)
+            message_callback: Callback for output messages
+            bytes_callback: Callback for raw PTY output frames, forwarded as received
             status_callback: Callback for status updates (status, data)
             error_callback: Callback for error handling (message, exception)
+            connect_timeout: Seconds to keep retrying while the server is unreachable
         """
         self.conn = conn
         self.message_callback = message_callback or self._default_message_callback
+        self.bytes_callback = bytes_callback or self._default_bytes_callback
         self.status_callback = status_callback or self._default_status_callback
         self.error_callback = error_callback or self._default_error_callback
+        self.connect_timeout = connect_timeout
         self.exit_code = None  # Track the exit code
+        self._token_cache: Optional[Tuple[str, float]] = None  # (token, renew after)
+        self._session_result_format_set = False
         
     def _default_message_callback(self, message: str) -> None:
         """Default message callback - just print"""
         print(message, end='')
+
+    def _default_bytes_callback(self, data: bytes) -> None:
+        """Default bytes callback - write to stdout's binary buffer"""
+        sys.stdout.flush()
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
         
     def _default_status_callback(self, status: str, data: Dict[str, Any]) -> None:
         """Default status callback - just print"""
@@ -60,11 +103,18 @@ class WebSocketClient:
         print(f"Error: {message}")
         
     def _get_auth_token(self) -> str:
-        """Get Snowflake session token for authentication"""
+        """Get Snowflake session token for authentication, reused until it is about to expire"""
+        if self._token_cache is not None and time.monotonic() < self._token_cache[1]:
+            return self._token_cache[0]
         try:
-            self.conn.cursor().execute("alter session set python_connector_query_result_format = 'json'")
-            token_data = self.conn._rest._token_request('ISSUE')
-            return token_data['data']['sessionToken']
+            if not self._session_result_format_set:
+                self.conn.cursor().execute("alter session set python_connector_query_result_format = 'json'")
+                self._session_result_format_set = True
+            token_data = self.conn._rest._token_request('ISSUE')['data']
+            validity = token_data.get('validityInSecondsST') or AUTH_TOKEN_DEFAULT_VALIDITY
+            expiry = time.monotonic() + validity - AUTH_TOKEN_RENEWAL_MARGIN
+            self._token_cache = (token_data['sessionToken'], expiry)
+            return self._token_cache[0]
         except Exception as e:
             raise WebSocketAuthenticationError(f"Failed to get authentication token: {e}")
         
@@ -85,28 +135,18 @@ class WebSocketClient:
             WebSocketServerError: If server returns error
         """
         try:
-            # Get authentication token
-            token = self._get_auth_token()
-            
-            # Prepare headers for authentication
-            headers = {'Authorization': f'Snowflake Token="{token}"'}
-            
-            # Create SSL context for wss connection
-            ssl_context = ssl.create_default_context()
-            
             # Connect to the WebSocket server
             try:
-                async with websockets.connect(
-                    server_url, 
-                    additional_headers=headers,
-                    ssl=ssl_context
-                ) as websocket:
+                websocket = await self._connect(server_url)
+                async with websocket:
                     
                     self.status_callback("connected", {"url": server_url})
                     
                     try:
-                        # Continuously read messages from the server
-                        async for message in websocket:
+                        # Continuously read messages from the server, as bytes to
+                        # skip UTF-8 validation of text frames
+                        while True:
+                            message = await websocket.recv(decode=False)
                             await self._handle_message(message)
                             # If we received a completion status, we can break
                             if self.exit_code is not None:
@@ -134,11 +174,55 @@ class WebSocketClient:
         
         return self.exit_code
     
-    async def _handle_message(self, message: str) -> None:
+    async def _connect(self, server_url: str):
+        """
+        Open the WebSocket connection, retrying for up to connect_timeout seconds
+        while the server is not reachable yet, e.g. because the service container
+        is still starting.
+        """
+        deadline = time.monotonic() + self.connect_timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            # Get authentication token
+            token = self._get_auth_token()
+            
+            # Prepare headers for authentication
+            headers = {'Authorization': f'Snowflake Token="{token}"'}
+
+            try:
+                return await websockets.connect(
+                    server_url, 
+                    additional_headers=headers,
+                    ssl=_ssl_context(),
+                    # Don't throttle bursts of PTY output or cap the frame size
+                    max_queue=None,
+                    max_size=None
+                )
+            except InvalidStatus as e:
+                if e.response.status_code not in RETRYABLE_STATUS_CODES or time.monotonic() >= deadline:
+                    raise
+                reason = e
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    raise
+                reason = e
+
+            self.status_callback("retrying", {"attempt": attempt, "reason": str(reason)})
+            delay = min(CONNECT_RETRY_INITIAL_DELAY * 2 ** (attempt - 1), CONNECT_RETRY_MAX_DELAY)
+            await asyncio.sleep(min(delay, deadline - time.monotonic()))
+
+    async def _handle_message(self, message: bytes) -> None:
         """Handle incoming WebSocket message"""
+        # Control and output messages are JSON objects, anything else is raw PTY
+        # output which is forwarded without decoding it
+        if not message.startswith(b'{'):
+            self.bytes_callback(message)
+            return
+
         try:
             # Try to parse as JSON
-            data = json.loads(message)
+            data = _json_loads(message)
             
             # Handle different message types
             msg_type = data.get('type', 'unknown')
@@ -167,11 +251,13 @@ class WebSocketClient:
                 
             else:
                 # Unknown message type, pass raw message
-                self.message_callback(f"Unknown message type '{msg_type}': {message}\n")
+                raw = message.decode('utf-8', errors='replace')
+                self.message_callback(f"Unknown message type '{msg_type}': {raw}\n")
                 
-        except json.JSONDecodeError:
-            # If not JSON, treat as raw output
-            self.message_callback(message)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # If not JSON, treat as raw output. orjson's decode error is a
+            # subclass of json.JSONDecodeError
+            self.bytes_callback(message)
         except WebSocketServerError:
             # Re-raise server errors
             raise
@@ -0,0 +1,149 @@
+import shutil
+import subprocess
+
+import pytest
+
+from snowflakecli.nextflow.util.nextflow_config import read_simple_config
+
+KEYS = ["snowflake.computePool", "snowflake.stageMounts", "snowflake.workDirStage"]
+
+# Configs the fast path accepts, the profile they are read with and the values
+# `nextflow config -flat` reports for them
+SUPPORTED_CONFIGS = [
+    (
+        """
+        snowflake {
+            computePool = 'POOL'   // trailing comment
+            workDirStage = "STAGE"
+        }
+        """,
+        None,
+        {"snowflake.computePool": "POOL", "snowflake.workDirStage": "STAGE"},
+    ),
+    (
+        """
+        snowflake.computePool = 'POOL'
+        params.reads = 'data/*.fq'
+        """,
+        None,
+        {"snowflake.computePool": "POOL"},
+    ),
+    (
+        """
+        snowflake.workDirStage = 'STAGE'
+        profiles {
+            sf {
+                snowflake.computePool = 'PROF'
+                snowflake.stageMounts = 'db.s.stage:/mnt/data'
+            }
+            other {
+                snowflake.computePool = 'OTHER'
+            }
+        }
+        """,
+        "sf",
+        {
+            "snowflake.computePool": "PROF",
+            "snowflake.stageMounts": "db.s.stage:/mnt/data",
+            "snowflake.workDirStage": "STAGE",
+        },
+    ),
+    (
+        """
+        profiles {
+            standard {
+                snowflake.computePool = 'STANDARD'
+            }
+        }
+        """,
+        None,
+        {"snowflake.computePool": "STANDARD"},
+    ),
+]
+
+# Configs the fast path must leave to nextflow
+UNSUPPORTED_CONFIGS = [
+    ("includeConfig 'other.config'\n", None),
+    ("snowflake.computePool = \"${POOL}\"\n", None),
+    ("snowflake.computePool = System.getenv('POOL')\n", None),
+    ("process { withName: foo { cpus = 2 } }\n", None),
+    ("snowflake {\n    computePool = 'POOL'\n", None),
+    ("profiles {\n    sf {\n        snowflake.computePool = 'PROF'\n    }\n}\n", "missing"),
+    ("profiles {\n    a {\n        x = 1\n    }\n    b {\n        y = 2\n    }\n}\n", "a,b"),
+    (
+        "profiles {\n    sf {\n        snowflake.computePool = 'PROF'\n    }\n}\nsnowflake.computePool = 'AFTER'\n",
+        "sf",
+    ),
+]
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """Empty project directory, launched from a separate directory without user config"""
+    monkeypatch.setenv("NXF_HOME", str(tmp_path / "nxf_home"))
+    monkeypatch.delenv("NXF_CONFIG_FILE", raising=False)
+    launch_dir = tmp_path / "launch"
+    launch_dir.mkdir()
+    monkeypatch.chdir(launch_dir)
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    return project_dir
+
+
+def write_config(project_dir, text):
+    config_path = project_dir / "nextflow.config"
+    config_path.write_text(text)
+    return config_path
+
+
+@pytest.mark.parametrize("text,profile,expected", SUPPORTED_CONFIGS)
+def test_supported_config(project, text, profile, expected):
+    assert read_simple_config(write_config(project, text), profile, KEYS) == expected
+
+
+@pytest.mark.parametrize("text,profile", UNSUPPORTED_CONFIGS)
+def test_unsupported_config(project, text, profile):
+    assert read_simple_config(write_config(project, text), profile, KEYS) is None
+
+
+def test_non_utf8_config(project):
+    config_path = project / "nextflow.config"
+    config_path.write_bytes(b"snowflake.computePool = '\xff'\n")
+    assert read_simple_config(config_path, None, KEYS) is None
+
+
+def test_other_config_files(project, monkeypatch, tmp_path):
+    config_path = write_config(project, "snowflake.computePool = 'POOL'\n")
+    assert read_simple_config(config_path, None, KEYS) is not None
+
+    monkeypatch.setenv("NXF_CONFIG_FILE", str(tmp_path / "custom.config"))
+    assert read_simple_config(config_path, None, KEYS) is None
+    monkeypatch.delenv("NXF_CONFIG_FILE")
+
+    (tmp_path / "launch" / "nextflow.config").write_text("snowflake.computePool = 'LAUNCH'\n")
+    assert read_simple_config(config_path, None, KEYS) is None
+
+    # Launched from the project directory itself
+    monkeypatch.chdir(project)
+    assert read_simple_config(config_path, None, KEYS) is not None
+
+    (tmp_path / "nxf_home").mkdir()
+    (tmp_path / "nxf_home" / "config").write_text("")
+    assert read_simple_config(config_path, None, KEYS) is None
+
+
+@pytest.mark.skipif(shutil.which("nextflow") is None, reason="nextflow is not installed")
+@pytest.mark.parametrize("text,profile,expected", SUPPORTED_CONFIGS)
+def test_agrees_with_nextflow(project, text, profile, expected):
+    write_config(project, text)
+    cmd = ["nextflow", "config", str(project), "-flat"]
+    if profile:
+        cmd += ["-profile", profile]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+
+    values = {}
+    for line in output.splitlines():
+        key, _, val = line.partition(" = ")
+        if key in KEYS:
+            values[key] = val.strip().replace("'", "")
+    assert values == expected